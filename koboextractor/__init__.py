@@ -1,5 +1,820 @@
-import requests
-from typing import Any, Dict, List
+# Modules which are slow to import (requests in particular) or optional are
+# only imported where they are needed, so that e.g. labeling with a schema
+# from load_schema() can start right away.
+import hashlib
+import io
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+
+def _requests():
+    import requests
+    return requests
+
+
+# Keys of a response that hold metadata rather than answers to questions.
+_META_KEYS_START = (
+    '_',
+    'meta/',
+    'formhub/',
+    'simserial',
+    'phonenumber',
+    'start',
+    'end',
+    'today',
+    'username',
+    'deviceid',
+    'subscriberid'
+)
+
+
+def _language_count(questions):
+    # Number of languages in the 'labels' of the questions from get_questions()
+    groups = [questions]
+    while groups:
+        group = groups.pop()
+        for entry in list(group.get('questions', {}).values()) + list(group.get('groups', {}).values()):
+            if 'labels' in entry:
+                return len(entry['labels'])
+        groups.extend(group.get('groups', {}).values())
+    return 1
+
+
+def _language_index(questions, language, languages=None):
+    # Resolves a language name from get_languages(), or checks a language
+    # index, and returns the index of the language in 'labels'
+    if language is None:
+        return None
+    if isinstance(language, int) and not isinstance(language, bool):
+        count = len(languages) if languages is not None else _language_count(questions)
+        if not 0 <= language < count:
+            raise ValueError(f'Language index {language} out of range for '
+                             f'{count} language(s)')
+        return language
+    if languages is None:
+        raise ValueError(f'Cannot resolve language {language!r} without the '
+                         f'list of languages from get_languages()')
+    try:
+        return list(languages).index(language)
+    except ValueError:
+        raise ValueError(f'Unknown language: {language!r}') from None
+
+
+def _translated(entry, language):
+    # Picks the label of a question or choice in the given language (index),
+    # falling back to the default language where there is no translation
+    if language is not None and 'labels' in entry:
+        labels = entry['labels']
+        if language < len(labels) and labels[language] is not None:
+            return labels[language]
+    return entry['label']
+
+
+def _export_row_to_result(header, row):
+    # Turns a row of an export into a dict like the ones in get_data()['results']
+    result = {}
+    for key, value in zip(header, row):
+        if value is None or value == '' or key == '_index':
+            # unanswered questions are omitted from the data API as well
+            continue
+        if key == '_id':
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                pass
+        elif not isinstance(value, str):
+            value = str(value)
+        result[key] = value
+    return result
+
+
+def _openpyxl():
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportError('Reading XLS exports requires the openpyxl package: '
+                          'pip3 install koboextractor[xls]') from None
+    return openpyxl
+
+
+def _unlabeled_question(question_code, value):
+    return {
+        'label': question_code,
+        'answer_code': value,
+        'answer_label': value
+    }
+
+
+def _label_question(group_codes, question_code, value, questions, choice_lists, unpack_multiples, language=None):
+    # Add and label the question
+    result_qn = {}
+    tmp_qn = questions
+    for group_code in group_codes:
+        if 'groups' in tmp_qn and group_code in tmp_qn['groups']:
+            tmp_qn = tmp_qn['groups'][group_code]
+        else:
+            # cannot find this question
+            return _unlabeled_question(question_code, value)
+    if not ('questions' in tmp_qn and question_code in tmp_qn['questions']):
+        # cannot find this question
+        return _unlabeled_question(question_code, value)
+    
+    tmp_qn = tmp_qn['questions'][question_code]
+    
+    if 'label' not in tmp_qn:
+        # cannot label this question and answer
+        return _unlabeled_question(question_code, value)
+    
+    result_qn['sequence'] = tmp_qn['sequence']
+    result_qn['label'] = _translated(tmp_qn, language)
+    result_qn['answer_code'] = value
+    
+    if tmp_qn['type'] == 'select_one':
+        try:
+            # get answer label from choice list
+            list_name = tmp_qn['list_name']
+            result_qn['answer_label'] = _translated(choice_lists[list_name][value], language)
+        except KeyError:
+            # Cannot label this answer
+            result_qn['answer_label'] = value
+    elif tmp_qn['type'] == 'select_multiple':
+        list_name = tmp_qn['list_name']
+        answer_codes = value.split()
+        try:
+            # get individual answer labels from choice list and
+            # concatenate them into this question's answer label
+            answer_label = ''
+            for split_answer_code in answer_codes:
+                answer_label = answer_label + _translated(choice_lists[list_name][split_answer_code], language) + ';'
+            result_qn['answer_label'] = answer_label
+        except KeyError:
+            # Cannot label this answer
+            result_qn['answer_label'] = value
+        if unpack_multiples: # TODO: Should this really be optional?
+            # unpack the individual choices
+            answer_codes = set(answer_codes)
+            result_qn['choices'] = {}
+            for choice_code, choice_dict in choice_lists[list_name].items():
+                selected = choice_code in answer_codes
+                result_qn['choices'][choice_code] = {
+                    'sequence': tmp_qn['choices'][choice_code]['sequence'],
+                    'label': _translated(choice_dict, language),
+                    'answer_code': int(selected),
+                    'answer_label': 'Yes' if selected else 'No'
+                }
+    else:
+        # no special treatment for simple types of questions
+        result_qn['answer_label'] = value
+    return result_qn
+
+
+def _inner_group_codes(outer_group_codes, key):
+    inner_group_codes = key.split('/')
+    for outer_group_code in outer_group_codes:
+        inner_group_codes.remove(outer_group_code)
+    return inner_group_codes
+
+
+def _label_repeat_group(outer_group_codes, repeat_list, questions, choice_lists, unpack_multiples, language=None):
+    repeat_group = {}
+    i = 0
+    for repeat_set in repeat_list:
+        repeat_group[i] = {}
+        for key, value in repeat_set.items():
+            inner_group_codes = _inner_group_codes(outer_group_codes, key)
+            
+            if isinstance(value, list):
+                # repeat group
+                repeat_group[i]['/'.join(inner_group_codes)] = _label_repeat_group(outer_group_codes + inner_group_codes, value, questions, choice_lists, unpack_multiples, language)
+            else:
+                # (QUESTION_GROUP(S)/)QUESTION_CODE type
+                question_code = inner_group_codes.pop()
+                repeat_group[i]['/'.join(inner_group_codes+[question_code])] = _label_question(outer_group_codes + inner_group_codes, question_code, value, questions, choice_lists, unpack_multiples, language)
+        i += 1
+    return repeat_group
+
+
+def _order_choices(choice_list):
+    # Orders a choice list from get_choices() into a tuple of
+    # (CHOICE_CODE, CHOICE_LABEL, LABELS) and a dict of the position of each
+    # choice code, to be shared by all UnpackedChoices of that list
+    sorted_choices = sorted(choice_list.items(), key=lambda choice: choice[1]['sequence'])
+    choices = tuple((choice_code, choice['label'], tuple(choice.get('labels', (choice['label'],))))
+                    for choice_code, choice in sorted_choices)
+    positions = {choice[0]: position for position, choice in enumerate(choices)}
+    return choices, positions
+
+
+class UnpackedChoices(Mapping):
+    """Read-only choices of a 'select_multiple' question.
+    
+    Used by ``KoboExtractor.get_questions()`` for the 'choices' of a
+    'select_multiple' question. It maps each choice code to a read-only
+    mapping (``types.MappingProxyType``) of the form::
+    
+        {
+            'label': CHOICE_LABEL,
+            'labels': (CHOICE_LABEL, ...),
+            'type': 'select_multiple_option',
+            'sequence': SEQUENCE_NUMBER
+        }
+    
+    The choices are stored once per choice list and shared by all questions
+    using that list, so only the sequence number of the first choice is kept
+    per question. Use ``to_dict()`` for a plain (and JSON serializable)
+    copy, e.g. ``json.dumps(questions, default=UnpackedChoices.to_dict)``.
+    
+    Attributes:
+        start: Sequence number of the first choice.
+    """
+    __slots__ = ('_choices', '_positions', 'start')
+    
+    def __init__(self,
+                 ordered_choices,  # type: Tuple[Tuple[Tuple[str, str, Tuple[str, ...]], ...], Dict[str, int]]
+                 start,            # type: int
+                 ):
+        # type: (...) -> None
+        self._choices, self._positions = ordered_choices
+        self.start = start
+    
+    def _choice(self, position):
+        _, label, labels = self._choices[position]
+        return {
+            'label': label,
+            'labels': labels,
+            'type': 'select_multiple_option',
+            'sequence': self.start + position
+        }
+    
+    def __getitem__(self, choice_code):
+        # type: (str) -> Mapping[str, Any]
+        # read-only, so that changes are not silently lost
+        return MappingProxyType(self._choice(self._positions[choice_code]))
+    
+    def __iter__(self):
+        # type: () -> Iterator[str]
+        return (choice[0] for choice in self._choices)
+    
+    def __len__(self):
+        # type: () -> int
+        return len(self._choices)
+    
+    def __repr__(self):
+        return f'UnpackedChoices({self.to_dict()!r})'
+    
+    def to_dict(self):
+        # type: () -> Dict[str, Dict[str, Any]]
+        """Returns a copy of the choices as a plain dict of dicts.
+        
+        Returns:
+            A dict mapping each choice code to a new dict as returned by
+            ``self[CHOICE_CODE]``, with 'labels' as a list.
+        """
+        return {choice[0]: dict(self._choice(position), labels=list(choice[2]))
+                for position, choice in enumerate(self._choices)}
+
+
+class LazyLabeledResults(Mapping):
+    """Read-only view of a response which labels questions on access.
+    
+    Behaves like the ``'results'`` dict returned by
+    ``KoboExtractor.label_result()``, but only labels a question (or repeat
+    group) when it is first accessed and caches the labeled value. This saves
+    time and memory when only a few questions of a large survey are read.
+    
+    Repeat groups are returned as mappings from the zero-based index of each
+    repetition to another ``LazyLabeledResults``.
+    
+    Attributes:
+        unlabeled_result: The wrapped response, as in
+            ``get_data(asset_uid)['results']``, or a single repetition of a
+            repeat group within it.
+        choice_lists: Dict of choice lists as returned by ``get_choices()``.
+        questions: Dict of questions as returned by ``get_questions()``.
+        unpack_multiples: If True, the choices of 'select_multiple' questions
+            are unpacked as in ``label_result()``.
+        language: Index of the language of the labels in
+            ``get_languages()``, or None for the default language.
+    """
+    def __init__(self,
+                 unlabeled_result,      # type: Dict[str, Any]
+                 choice_lists,          # type: Dict[str, Dict[str, Any]]
+                 questions,             # type: Dict[str, Dict[str, Any]]
+                 unpack_multiples,      # type: bool
+                 outer_group_codes=(),  # type: Tuple[str, ...]
+                 language=None,         # type: Optional[int]
+                 ):
+        # type: (...) -> None
+        self.unlabeled_result = unlabeled_result
+        self.choice_lists = choice_lists
+        self.questions = questions
+        self.unpack_multiples = unpack_multiples
+        self.language = language
+        self._outer_group_codes = list(outer_group_codes)
+        self._index = None
+        self._cache = {}
+    
+    def _build_index(self):
+        # Maps each labeled key to its raw key, without labeling anything yet
+        index = {}
+        for key, value in self.unlabeled_result.items():
+            if not self._outer_group_codes and key.startswith(_META_KEYS_START):
+                continue
+            if self._outer_group_codes:
+                index['/'.join(_inner_group_codes(self._outer_group_codes, key))] = key
+            else:
+                index[key] = key
+        self._index = index
+        return index
+    
+    def _label(self, key):
+        value = self.unlabeled_result[key]
+        inner_group_codes = _inner_group_codes(self._outer_group_codes, key)
+        if isinstance(value, list):
+            group_codes = tuple(self._outer_group_codes + inner_group_codes)
+            return {i: LazyLabeledResults(repeat_set, self.choice_lists,
+                                          self.questions, self.unpack_multiples,
+                                          group_codes, self.language)
+                    for i, repeat_set in enumerate(value)}
+        question_code = inner_group_codes.pop()
+        return _label_question(self._outer_group_codes + inner_group_codes,
+                               question_code, value, self.questions,
+                               self.choice_lists, self.unpack_multiples,
+                               self.language)
+    
+    def __getitem__(self, key):
+        # type: (str) -> Any
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        if self._outer_group_codes:
+            index = self._index if self._index is not None else self._build_index()
+            raw_key = index[key]
+        else:
+            # At the top level the labeled key is the raw key, so a single
+            # question can be labeled without looking at the others
+            if not isinstance(key, str) or key.startswith(_META_KEYS_START):
+                raise KeyError(key)
+            raw_key = key
+        labeled = self._label(raw_key)
+        self._cache[key] = labeled
+        return labeled
+    
+    def __iter__(self):
+        # type: () -> Iterator[str]
+        index = self._index if self._index is not None else self._build_index()
+        return iter(index)
+    
+    def __len__(self):
+        # type: () -> int
+        index = self._index if self._index is not None else self._build_index()
+        return len(index)
+    
+    def to_dict(self):
+        # type: () -> Dict[str, Any]
+        """Labels all remaining questions and returns a plain dict.
+        
+        Returns:
+            A dict identical to the ``'results'`` of ``label_result()`` with
+            ``lazy=False``.
+        """
+        index = self._index if self._index is not None else self._build_index()
+        results = {}
+        for key, raw_key in index.items():
+            value = self[key]
+            if isinstance(self.unlabeled_result[raw_key], list):
+                value = {i: repeat_set.to_dict() for i, repeat_set in value.items()}
+            results[key] = value
+        return results
+
+
+class _LazyMeta(Mapping):
+    # Read-only view of the metadata of a response, for label_result() with
+    # lazy=True, so that creating it does not go through all keys
+    __slots__ = ('_result',)
+    
+    def __init__(self, unlabeled_result):
+        self._result = unlabeled_result
+    
+    def __getitem__(self, key):
+        if not isinstance(key, str) or not key.startswith(_META_KEYS_START):
+            raise KeyError(key)
+        return self._result[key]
+    
+    def __iter__(self):
+        return (key for key in self._result if key.startswith(_META_KEYS_START))
+    
+    def __len__(self):
+        return sum(1 for _ in self)
+    
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def _label_result(unlabeled_result, choice_lists, questions, unpack_multiples, lazy=False, language=None):
+    # Labels a single response in a single language, given as the index from
+    # _language_index(), see KoboExtractor.label_result()
+    if lazy:
+        return {
+            'meta': _LazyMeta(unlabeled_result),
+            'results': LazyLabeledResults(unlabeled_result, choice_lists,
+                                          questions, unpack_multiples,
+                                          language=language)
+        }
+    
+    meta = {}
+    results = {}
+    for key, value in unlabeled_result.items():
+        # there are various keys within an unlabeled_result dict, and not
+        # all of them belong to survey questions:
+        # key starts with meta_keys_start -> metadata
+        # otherwise, key points to a list -> (GROUP_CODE(S)/)REPEAT_GROUP_CODE type
+        # otherwise -> (GROUP_CODE(S)/)/QUESTION_CODE type (number of '/' -> number of nested groups)
+        # otherwise -> groupless question
+        if key.startswith(_META_KEYS_START):
+            meta[key] = value
+            continue
+        
+        if isinstance(value, list):
+            # repeat group
+            group_codes = key.split('/')
+            results['/'.join(group_codes)] = _label_repeat_group(group_codes, value, questions, choice_lists, unpack_multiples, language)
+        
+        else:
+            # (GROUP_CODE(S)/)/QUESTION_CODE type (number of '/' -> number of nested groups)
+            group_codes = key.split('/')
+            question_code = group_codes.pop()
+            results[key] = _label_question(group_codes, question_code, value, questions, choice_lists, unpack_multiples, language)
+    
+    return {
+        'meta': meta,
+        'results': results
+    }
+
+
+def _put(target, item, stop):
+    # Puts an item into a bounded queue, unless the pipeline is being stopped
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+# Schema used by the labeling processes of KoboExtractor.iter_labeled_data(),
+# sent once to each process instead of with every chunk of responses
+_worker_schema = None
+
+
+def _init_label_worker(choice_lists, questions, unpack_multiples, language, serializer):
+    global _worker_schema
+    _worker_schema = (choice_lists, questions, unpack_multiples, language, serializer)
+
+
+def _label_chunk(unlabeled_results):
+    # language is either a single language index, or a list of (LANGUAGE,
+    # index) pairs to label each response once per language
+    choice_lists, questions, unpack_multiples, language, serializer = _worker_schema
+    labeled_results = []
+    for unlabeled_result in unlabeled_results:
+        if isinstance(language, list):
+            labeled = {lang: _label_result(unlabeled_result, choice_lists, questions,
+                                           unpack_multiples, language=index)
+                       for lang, index in language}
+        else:
+            labeled = _label_result(unlabeled_result, choice_lists, questions,
+                                    unpack_multiples, language=language)
+        labeled_results.append(serializer(labeled) if serializer else labeled)
+    return labeled_results
+
+
+class SubmissionDeduplicator:
+    """Filters out responses which have been seen before.
+    
+    Remembers the ``_id`` of every response passed through ``filter()``
+    together with a short hash of its ``_uuid`` and ``_last_edited`` keys,
+    which change when a response is edited on the server. ``filter()`` then
+    only lets through new responses and responses which changed since they
+    were last seen, e.g. when pages overlap after a retry or when querying
+    with ``submitted_after``.
+    
+    The index is kept in an SQLite database on disk, so its memory use does
+    not grow with the number of responses. Give a ``path`` to reuse the index
+    in the next run of an incremental download; otherwise a temporary file is
+    used and deleted by ``close()``.
+    
+    Responses with neither ``_id`` nor ``_uuid`` cannot be told apart and are
+    always let through without being recorded.
+    
+    Example::
+        
+        from koboextractor import KoboExtractor, SubmissionDeduplicator
+        kobo = KoboExtractor(KOBO_TOKEN, 'https://kf.kobotoolbox.org/api/v2')
+        with SubmissionDeduplicator('seen.sqlite') as seen:
+            for result in seen.filter(kobo.iter_data(asset_uid)):
+                ...
+    
+    Attributes:
+        path: Path of the SQLite database file. Default: None, i.e. a
+            temporary file. ':memory:' keeps the index in memory instead,
+            where it grows with the number of responses.
+        batch_size: Number of responses looked up in the index at a time
+            (default: 1000).
+    """
+    def __init__(self,
+                 path=None,         # type: Optional[str]
+                 batch_size=1000,   # type: int
+                 ):
+        # type: (...) -> None
+        import sqlite3
+        self._temporary = path is None
+        if self._temporary:
+            import tempfile
+            fd, path = tempfile.mkstemp(prefix='koboextractor-', suffix='.sqlite')
+            os.close(fd)
+        self.path = path
+        self.batch_size = batch_size
+        self._db = sqlite3.connect(path)
+        self._db.execute('CREATE TABLE IF NOT EXISTS submissions '
+                         '(id TEXT PRIMARY KEY, marker BLOB) WITHOUT ROWID')
+        self._db.commit()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def __len__(self):
+        # type: () -> int
+        return self._db.execute('SELECT COUNT(*) FROM submissions').fetchone()[0]
+    
+    @staticmethod
+    def _key(result):
+        # type: (Dict[str, Any]) -> Optional[Tuple[str, bytes]]
+        submission_id = result.get('_id', result.get('_uuid'))
+        if submission_id is None:
+            return None
+        marker = f'{result.get("_uuid", "")}|{result.get("_last_edited", "")}'
+        return str(submission_id), hashlib.blake2b(marker.encode(), digest_size=8).digest()
+    
+    def filter(self,
+               results,  # type: Iterable[Dict[str, Any]]
+               ):
+        # type: (...) -> Iterator[Dict[str, Any]]
+        """Yields the responses which are new or changed.
+        
+        Each yielded response is recorded in the index, so it is not yielded
+        again unless it changes.
+        
+        Args:
+            results: An iterable of responses as in
+                ``get_data(asset_uid)['results']`` or ``iter_data(asset_uid)``.
+        
+        Yields:
+            The responses not seen before, or changed since, in their original
+            order.
+        """
+        batch = []
+        for result in results:
+            batch.append(result)
+            if len(batch) >= self.batch_size:
+                yield from self._filter_batch(batch)
+                batch = []
+        if batch:
+            yield from self._filter_batch(batch)
+    
+    def _filter_batch(self, batch):
+        keys = [self._key(result) for result in batch]
+        ids = list({key[0] for key in keys if key is not None})
+        known = {}
+        # Older SQLite versions allow at most 999 parameters per statement
+        for i in range(0, len(ids), 500):
+            some_ids = ids[i:i + 500]
+            known.update(self._db.execute(
+                f'SELECT id, marker FROM submissions WHERE id IN ({",".join("?" * len(some_ids))})',
+                some_ids))
+        emitted = []
+        try:
+            for result, key in zip(batch, keys):
+                if key is None:
+                    # cannot be identified, so it cannot be a known duplicate
+                    yield result
+                    continue
+                submission_id, marker = key
+                if known.get(submission_id) == marker:
+                    continue
+                # also catches duplicates within the same batch
+                known[submission_id] = marker
+                emitted.append((submission_id, marker))
+                yield result
+        finally:
+            # Only record what has been handed out, even if the consumer stops
+            self._db.executemany('INSERT OR REPLACE INTO submissions VALUES (?, ?)',
+                                 emitted)
+            self._db.commit()
+    
+    def close(self):
+        # type: () -> None
+        """Closes the index database, and deletes it if it is temporary."""
+        self._db.close()
+        if self._temporary:
+            os.remove(self.path)
+            self._temporary = False
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise ImportError('Packing results requires the msgpack package: '
+                          'pip3 install koboextractor[msgpack]') from None
+    return msgpack
+
+
+def pack_results(results):
+    # type: (Iterable[Dict[str, Any]]) -> bytes
+    """Encodes a batch of responses into a compact binary form.
+    
+    The responses are encoded with msgpack. Every key (e.g.
+    'GROUP_CODE/QUESTION_CODE') and every distinct text answer is stored only
+    once per batch, and each response only refers to them by their index. Since
+    the same keys and answer codes repeat in most responses, this typically
+    takes a fraction of the space of the same responses as JSON, and reading
+    them back with ``unpack_results()`` is faster than ``json.loads()``.
+    Requires the msgpack package.
+    
+    Several packed batches can be written to the same file one after the other
+    and read back with ``iter_packed_results()``.
+    
+    Args:
+        results: Responses as in ``get_data(asset_uid)['results']``.
+    
+    Returns:
+        The packed batch of responses.
+    """
+    key_indices = {}
+    value_indices = {}
+    values = []
+    rows = []
+    for result in results:
+        row_keys = [key_indices.setdefault(key, len(key_indices)) for key in result]
+        row_values = []
+        for value in result.values():
+            if type(value) is str:
+                index = value_indices.setdefault(value, len(values))
+                if index == len(values):
+                    values.append(value)
+            else:
+                # Only strings are shared, since other values can be equal but
+                # different (1 and True, 0.0 and -0.0). Numbers are small
+                # anyway, and repeat groups are stored as they are.
+                index = len(values)
+                values.append(value)
+            row_values.append(index)
+        rows.append([row_keys, row_values])
+    return _msgpack().packb([list(key_indices), values, rows], use_bin_type=True)
+
+
+def _unpacked_rows(batch):
+    keys, values, rows = batch
+    key = keys.__getitem__
+    value = values.__getitem__
+    return [dict(zip(map(key, row_keys), map(value, row_values)))
+            for row_keys, row_values in rows]
+
+
+def unpack_results(data):
+    # type: (bytes) -> List[Dict[str, Any]]
+    """Decodes a batch of responses packed with ``pack_results()``.
+    
+    Args:
+        data: A single packed batch.
+    
+    Returns:
+        The list of responses.
+    """
+    return _unpacked_rows(_msgpack().unpackb(data, raw=False))
+
+
+def iter_packed_results(fp):
+    # type: (BinaryIO) -> Iterator[Dict[str, Any]]
+    """Reads the responses of all batches packed with ``pack_results()``.
+    
+    Example::
+        
+        with open('results.bin', 'ab') as f:
+            f.write(pack_results(kobo.get_data(asset_uid)['results']))
+        with open('results.bin', 'rb') as f:
+            for result in iter_packed_results(f):
+                ...
+    
+    Args:
+        fp: A binary file object containing one or more packed batches.
+    
+    Yields:
+        Each response of each batch, in order.
+    """
+    for batch in _msgpack().Unpacker(fp, raw=False):
+        yield from _unpacked_rows(batch)
+
+
+# Version of the file format written by save_schema()
+_SCHEMA_FORMAT = 2
+
+
+def _compact_questions(group):
+    # Copies a questions tree from get_questions(), replacing the choices of
+    # each select_multiple question by the sequence number of its first choice
+    compact = dict(group)
+    if 'questions' in group:
+        compact['questions'] = {}
+        for code, question in group['questions'].items():
+            if isinstance(question.get('choices'), UnpackedChoices):
+                question = dict(question, choices=question['choices'].start)
+            compact['questions'][code] = question
+    if 'groups' in group:
+        compact['groups'] = {code: _compact_questions(subgroup)
+                             for code, subgroup in group['groups'].items()}
+    return compact
+
+
+def _expand_questions(group, choice_lists, ordered_choices):
+    # Reverses _compact_questions() in place, sharing the ordered choices of
+    # each list between questions as get_questions() does
+    for question in group.get('questions', {}).values():
+        if isinstance(question.get('choices'), int):
+            list_name = question['list_name']
+            if list_name not in ordered_choices:
+                ordered_choices[list_name] = _order_choices(choice_lists[list_name])
+            question['choices'] = UnpackedChoices(ordered_choices[list_name],
+                                                  question['choices'])
+    for subgroup in group.get('groups', {}).values():
+        _expand_questions(subgroup, choice_lists, ordered_choices)
+
+
+def save_schema(schema, path):
+    # type: (Dict[str, Any], str) -> None
+    """Saves a schema to a file, to be loaded with ``load_schema()``.
+    
+    Loading a saved schema is faster than downloading the asset and building
+    the schema again, e.g. in short-lived workers which only label responses.
+    Each choice list is saved once, and 'select_multiple' questions only
+    refer to it, so the file is about as small as the asset itself.
+    
+    Example::
+        
+        kobo = KoboExtractor(KOBO_TOKEN, 'https://kf.kobotoolbox.org/api/v2')
+        schema = kobo.get_schema(kobo.get_asset(asset_uid), unpack_multiples=True)
+        save_schema(schema, 'schema.json')
+        
+        # later, in a worker
+        schema = load_schema('schema.json')
+        labeled = kobo.label_result(result, schema['choices'],
+                                    schema['questions'], True)
+    
+    Args:
+        schema: A dict as returned by ``KoboExtractor.get_schema()``.
+        path: Path of the file to write.
+    """
+    snapshot = {'format': _SCHEMA_FORMAT}
+    snapshot.update(schema)
+    snapshot['questions'] = _compact_questions(schema['questions'])
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def load_schema(path):
+    # type: (str) -> Dict[str, Any]
+    """Loads a schema saved with ``save_schema()``.
+    
+    Args:
+        path: Path of the file written by ``save_schema()``.
+    
+    Returns:
+        A dict as returned by ``KoboExtractor.get_schema()``.
+    
+    Raises:
+        ValueError: The file was not written by a compatible version of
+            ``save_schema()``.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        snapshot = json.load(f)
+    if snapshot.pop('format', None) != _SCHEMA_FORMAT:
+        raise ValueError(f'{path} is not a schema saved by save_schema()')
+    _expand_questions(snapshot['questions'], snapshot['choices'], {})
+    return snapshot
+
 
 class KoboExtractor:
     """Extracts collected data from KoBoToolbox.
@@ -30,7 +845,17 @@ class KoboExtractor:
         self.token = token
         self.endpoint = endpoint
         self.debug = debug
-        pass
+        self._schemas = {}
+    
+    
+    def _headers(self):
+        # type: () -> Dict[str, str]
+        return {
+            'Authorization': f'Token {self.token}',
+            # Ask explicitly for every compression requests can decode, i.e.
+            # gzip and deflate, and br or zstd if their packages are installed
+            'Accept-Encoding': _requests().utils.default_headers()['Accept-Encoding']
+        }
     
     
     def list_assets(self) -> Dict[str, Any]:
@@ -44,9 +869,9 @@ class KoboExtractor:
             https://kf.kobotoolbox.org/api/v2/assets/ to see a description.
         """
         url = f'{self.endpoint}/assets.json'
-        headers = {'Authorization': f'Token {self.token}'}
+        headers = self._headers()
         if self.debug: print(f'KoboExtractor.list_assets: Calling {url}')
-        response = requests.get(url, headers=headers)
+        response = _requests().get(url, headers=headers)
         return response.json()
     
     
@@ -68,9 +893,9 @@ class KoboExtractor:
             description.
         """
         url = f'{self.endpoint}/assets/{asset_uid}.json'
-        headers = {'Authorization': f'Token {self.token}'}
+        headers = self._headers()
         if self.debug: print(f'KoboExtractor.get_asset: Calling {url}')
-        response = requests.get(url , headers=headers)
+        response = _requests().get(url , headers=headers)
         return response.json()
     
     
@@ -118,6 +943,15 @@ class KoboExtractor:
         if self.debug and query and submitted_after:
             print("KoboExtractor.get_data(): Ignoring argument "
                   "'submitted_after' because 'query' is specified.")
+        url = self._data_url(asset_uid, query, start, limit, submitted_after)
+        headers = self._headers()
+        if self.debug: print(f'KoboExtractor.get_data: Calling {url}')
+        response = _requests().get(url, headers=headers)
+        return response.json()
+    
+    
+    def _data_url(self, asset_uid, query, start, limit, submitted_after):
+        # type: (str, str, int, int, str) -> str
         url = f'{self.endpoint}/assets/{asset_uid}/data.json'
         
         if query or start or limit or submitted_after:
@@ -136,13 +970,279 @@ class KoboExtractor:
                 url += '&'
         if limit:
             url += f'limit={limit}'
+        return url
+    
+    
+    def iter_data(self,
+                  asset_uid,             # type: str
+                  query=None,            # type: str
+                  submitted_after=None,  # type: str
+                  page_size=30000,       # type: int
+                  deduplicator=None,     # type: Optional[SubmissionDeduplicator]
+                  ):
+        # type: (...) -> Iterator[Dict[str, Any]]
+        """Iterates over the data (responses) of an asset, page by page.
         
-        headers = {'Authorization': f'Token {self.token}'}
-        if self.debug: print(f'KoboExtractor.get_data: Calling {url}')
-        response = requests.get(url, headers=headers)
+        Calls ``get_data()`` with increasing ``start`` until as many responses
+        as given by its 'count' have been downloaded, and yields the responses
+        one by one.
+        
+        Args:
+            asset_uid: Unique ID of the asset.
+            query: Passed on to ``get_data()``.
+            submitted_after: Passed on to ``get_data()``.
+            page_size: Number of responses per page (max: 30000,
+                default: 30000).
+            deduplicator: Optional ``SubmissionDeduplicator``. If given, only
+                responses which it has not seen before, or which have changed
+                since, are yielded.
+        
+        Yields:
+            Each response as in ``get_data(asset_uid)['results']``.
+        """
+        def pages():
+            start = 0
+            while True:
+                data = self.get_data(asset_uid, query=query, start=start,
+                                     limit=page_size,
+                                     submitted_after=submitted_after)
+                results = data['results']
+                yield from results
+                start += len(results)
+                # The server may return fewer results than asked for, so
+                # only stop once 'count' responses have been read
+                if not results or start >= data['count']:
+                    return
+        
+        if deduplicator is not None:
+            yield from deduplicator.filter(pages())
+        else:
+            yield from pages()
+    
+    
+    def create_export(self,
+                      asset_uid,                # type: str
+                      export_type='csv',        # type: str
+                      multiple_select='summary',  # type: str
+                      ):
+        # type: (...) -> Dict[str, Any]
+        """Starts an export of the data of an asset on the server.
+        
+        Asks KoBoToolbox to build a file with all responses to an asset. This
+        is much faster than paging through ``get_data()`` for assets with very
+        many responses. The export is built asynchronously; use
+        ``wait_for_export()`` to wait until it is complete.
+        
+        The export uses the question codes as column names, with groups
+        separated by '/', as in the keys of ``get_data()``.
+        
+        Args:
+            asset_uid: Unique ID of the asset. Obtainable e.g. through
+                ``list_assets()['results'][i]['uid']`` (for your first asset, use
+                ``i=0``).
+            export_type: 'csv' or 'xls' (default: 'csv').
+            multiple_select: How to export 'select_multiple' questions: 'summary'
+                for a single column with the space-separated answer codes as in
+                ``get_data()``, 'details' for one column per choice, or 'both'.
+                Default: 'summary'.
+        
+        Returns:
+            A dict describing the export task. Its 'uid' identifies the export
+            and its 'status' is one of 'created', 'processing', 'complete' or
+            'error'. Log into KoBoToolbox and visit
+            https://kf.kobotoolbox.org/api/v2/assets/YOUR_ASSET_UID/exports/
+            for a more detailed description.
+        """
+        url = f'{self.endpoint}/assets/{asset_uid}/exports/'
+        headers = self._headers()
+        payload = {
+            'type': export_type,
+            'lang': '_xml',
+            'group_sep': '/',
+            'hierarchy_in_labels': 'true',
+            'fields_from_all_versions': 'true',
+            'multiple_select': multiple_select
+        }
+        if self.debug: print(f'KoboExtractor.create_export: Calling {url}')
+        response = _requests().post(url, headers=headers, json=payload)
+        return response.json()
+    
+    
+    def get_export(self,
+                   asset_uid,   # type: str
+                   export_uid,  # type: str
+                   ):
+        # type: (...) -> Dict[str, Any]
+        """Gets information on an export of an asset.
+        
+        Args:
+            asset_uid: Unique ID of the asset.
+            export_uid: Unique ID of the export, as in
+                ``create_export(asset_uid)['uid']``.
+        
+        Returns:
+            A dict describing the export task as in ``create_export()``. Once
+            its 'status' is 'complete', 'result' holds the URL of the file.
+        """
+        url = f'{self.endpoint}/assets/{asset_uid}/exports/{export_uid}.json'
+        headers = self._headers()
+        if self.debug: print(f'KoboExtractor.get_export: Calling {url}')
+        response = _requests().get(url, headers=headers)
         return response.json()
     
     
+    def wait_for_export(self,
+                        asset_uid,              # type: str
+                        export_uid,             # type: str
+                        poll_interval=1.0,      # type: float
+                        max_poll_interval=30.0, # type: float
+                        timeout=None,           # type: Optional[float]
+                        ):
+        # type: (...) -> Dict[str, Any]
+        """Waits until an export of an asset is complete.
+        
+        Polls the export with ``get_export()``. The time between two polls
+        starts at ``poll_interval`` and grows by half after every poll up to
+        ``max_poll_interval``, so small exports finish quickly without
+        flooding the server while large ones are built.
+        
+        Args:
+            asset_uid: Unique ID of the asset.
+            export_uid: Unique ID of the export, as in
+                ``create_export(asset_uid)['uid']``.
+            poll_interval: Seconds to wait before the second poll (default: 1).
+            max_poll_interval: Maximum seconds between two polls (default: 30).
+            timeout: Maximum seconds to wait in total, or None to wait
+                indefinitely (default: None).
+        
+        Returns:
+            A dict describing the complete export as in ``get_export()``.
+        
+        Raises:
+            RuntimeError: The server failed to build the export, or returned
+                no or an unknown status.
+            TimeoutError: The export was not complete within ``timeout``.
+        """
+        started = time.monotonic()
+        while True:
+            export = self.get_export(asset_uid, export_uid)
+            status = export.get('status')
+            if status == 'complete':
+                return export
+            if status not in ('created', 'processing'):
+                # 'error', or a response which is not an export at all, e.g.
+                # {'detail': 'Not found.'}
+                raise RuntimeError(f'Export {export_uid} of asset {asset_uid} failed: '
+                                   f'{export.get("messages", export)}')
+            if timeout is not None and time.monotonic() - started + poll_interval > timeout:
+                raise TimeoutError(f'Export {export_uid} of asset {asset_uid} '
+                                   f'not complete after {timeout} seconds')
+            if self.debug: print(f'KoboExtractor.wait_for_export: Export is {status}, '
+                                 f'polling again in {poll_interval:.1f}s')
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 1.5, max_poll_interval)
+    
+    
+    def iter_export_data(self,
+                         asset_uid,             # type: str
+                         export_type='csv',     # type: str
+                         chunk_size=1 << 20,    # type: int
+                         poll_interval=1.0,     # type: float
+                         max_poll_interval=30.0,  # type: float
+                         timeout=None,          # type: Optional[float]
+                         ):
+        # type: (...) -> Iterator[Dict[str, Any]]
+        """Iterates over the data (responses) of an asset using an export.
+        
+        Creates an export with ``create_export()``, waits for it with
+        ``wait_for_export()`` and downloads the file in chunks of
+        ``chunk_size`` bytes. The rows are parsed while downloading (CSV) or
+        right after (XLS), and yielded one by one, so the responses never have
+        to be held in memory together.
+        
+        Each response is a dict like the ones in ``get_data()['results']``,
+        with the exception that repeat groups are not included, and that all
+        answers are strings. Unanswered questions are omitted.
+        
+        Example::
+            
+            from koboextractor import KoboExtractor
+            kobo = KoboExtractor(KOBO_TOKEN, 'https://kf.kobotoolbox.org/api/v2')
+            for result in kobo.iter_export_data(asset_uid):
+                labeled = kobo.label_result(result, choice_lists, questions, True)
+        
+        Args:
+            asset_uid: Unique ID of the asset.
+            export_type: 'csv' or 'xls' (default: 'csv'). Reading XLS exports
+                requires the openpyxl package.
+            chunk_size: Size in bytes of the downloaded chunks (default: 1 MiB).
+            poll_interval: Passed on to ``wait_for_export()``.
+            max_poll_interval: Passed on to ``wait_for_export()``.
+            timeout: Passed on to ``wait_for_export()``.
+        
+        Yields:
+            One dict per response, in the order of the export.
+        """
+        import csv
+        import tempfile
+        if export_type != 'csv':
+            # fail before creating an export which cannot be read
+            openpyxl = _openpyxl()
+        export = self.create_export(asset_uid, export_type)
+        export = self.wait_for_export(asset_uid, export['uid'], poll_interval,
+                                      max_poll_interval, timeout)
+        url = export['result']
+        headers = self._headers()
+        if self.debug: print(f'KoboExtractor.iter_export_data: Downloading {url}')
+        with _requests().get(url, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            if export_type == 'csv':
+                response.raw.decode_content = True
+                # Let the text wrapper see the end of the file instead of a
+                # closed stream
+                response.raw.auto_close = False
+                buffered = io.BufferedReader(response.raw, buffer_size=chunk_size)
+                lines = io.TextIOWrapper(buffered, encoding='utf-8-sig', newline='')
+                rows = csv.reader(lines, delimiter=';')
+                header = next(rows, None)
+                for row in rows:
+                    yield _export_row_to_result(header, row)
+                return
+            
+            # XLSX files can only be read as a whole, so spool them to disk
+            with tempfile.TemporaryFile() as spool:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    spool.write(chunk)
+                spool.seek(0)
+                workbook = openpyxl.load_workbook(spool, read_only=True)
+                try:
+                    rows = workbook.worksheets[0].iter_rows(values_only=True)
+                    header = next(rows, None)
+                    for row in rows:
+                        yield _export_row_to_result(header, row)
+                finally:
+                    workbook.close()
+    
+    
+    def get_languages(self,
+                      asset,  # type: Dict[str, Any]
+                      ):
+        # type: (...) -> List[Optional[str]]
+        """Lists the languages (translations) of a survey.
+        
+        Args:
+            asset: A dict as returned by ``get_asset()``.
+        
+        Returns:
+            A list of the names of the survey's languages, e.g.
+            ``['English (en)', 'French (fr)']``, in the order of the labels in
+            the 'labels' lists of ``get_choices()`` and ``get_questions()``.
+            The first entry is the default language. Its name is None if the
+            survey has no translations.
+        """
+        return list(asset['content'].get('translations', [None]))
+    
+    
     def get_choices(self,
                     asset,  # type: Dict[str, Any]
                     ):
@@ -162,6 +1262,7 @@ class KoboExtractor:
                 {
                     LIST_NAME: {
                         'label': CHOICE_LABEL,
+                        'labels': [CHOICE_LABEL, ...],
                         'sequence': SEQUENCE_NUMBER
                     }
                 }
@@ -169,7 +1270,8 @@ class KoboExtractor:
             where CHOICE_LABEL is the label (text) of the choice in the survey's
             default language, and SEQUENCE_NUMBER is an incrementing number that
             can be used to restore the order of the choices in the survey from
-            this unordered dict.
+            this unordered dict. 'labels' holds the label in each language of
+            ``get_languages()``, in the same order.
         """
         choice_lists = {}
         sequence = 0
@@ -177,11 +1279,14 @@ class KoboExtractor:
             if choice['list_name'] not in choice_lists:
                 choice_lists[choice['list_name']] = {}
             if 'label' in choice:
-                label = choice['label'][0]
+                labels = list(choice['label'])
+                label = labels[0]
             else:
+                labels = [None]
                 label = None
             choice_lists[choice['list_name']][choice['name']] = {
                 'label': label,
+                'labels': labels,
                 'sequence': sequence
             }
             sequence += 1
@@ -191,6 +1296,7 @@ class KoboExtractor:
     def get_questions(self,
                       asset,            # type: Dict[str, Any]
                       unpack_multiples, # type: bool
+                      choice_lists=None,  # type: Dict[str, Dict[str, Any]]
                       ):
         # type: (...) -> Dict[str, Dict[str, Any]]
         """Groups the choices (answer options) of a survey into a dict.
@@ -205,6 +1311,9 @@ class KoboExtractor:
                 ``get_choices()`` are added as subsequent questions following a
                 multiple choice question (type 'select_multiple'). The type of
                 these additional questions is set to 'select_multiple_option'.
+            choice_lists: Dict of choice lists as returned by
+                ``get_choices(asset)``. Only used with ``unpack_multiples``. If
+                not provided, the choices are read from ``asset`` again.
         
         Returns:
             A dict of the form::
@@ -213,6 +1322,7 @@ class KoboExtractor:
                     'groups': {
                         GROUP_CODE: {
                             'label': GROUP_LABEL,
+                            'labels': [GROUP_LABEL, ...],
                             'sequence': SEQUENCE_NUMBER,
                             'repeat': True/False,
                             'questions': {
@@ -220,10 +1330,12 @@ class KoboExtractor:
                                     'type': QUESTION_TYPE,
                                     'sequence': SEQUENCE_NUMBER,
                                     'label': QUESTION_LABEL,
+                                    'labels': [QUESTION_LABEL, ...],
                                     'list_name': CHOICE_LIST_NAME,
                                     'choices': {
                                         CHOICE_CODE: {
                                             'label': CHOICE_LABEL,
+                                            'labels': [CHOICE_LABEL, ...],
                                             'type': 'select_multiple_option',
                                             'sequence': SEQUENCE_NUMBER
                                         }
@@ -245,22 +1357,36 @@ class KoboExtractor:
                         QUESTION_CODE: {
                             ...
                         }
+                    }
                 }
             
             where GROUP_LABEL, QUESTION_LABEL and CHOICE_LABEL are the labels
             (text) of the group or question in the survey's default language.
+            'labels' holds the label in each language of ``get_languages()``,
+            in the same order.
             SEQUENCE_NUMBER is an incrementing number that can be used to
             restore the order of the questions in the survey from this
             unordered dict.
             
             Depending on the question, not all keys may be present.
             
+            'choices' is a read-only ``UnpackedChoices`` mapping rather than a
+            dict, and each choice in it is a read-only mapping as well. All
+            questions using the same choice list share its choices, so each
+            question only adds the SEQUENCE_NUMBER of its first choice. To
+            serialize the questions as JSON, pass
+            ``default=UnpackedChoices.to_dict`` to ``json.dumps()``.
+            
             An additional question of the type '_or_other' is inserted after any
             question which type ends in '_or_other', to cover the reponses to
             such questions.
         """
         if unpack_multiples:
-            choices = self.get_choices(asset)
+            if choice_lists is None:
+                choice_lists = self.get_choices(asset)
+            # Each choice list is ordered only once and then shared by all
+            # questions using it
+            ordered_choices = {}
         
         sequence = 0
         root_group = {}
@@ -290,6 +1416,7 @@ class KoboExtractor:
                     tmp_group['repeat'] = False
                 if 'label' in qn:
                     tmp_group['label'] = qn['label'][0]
+                    tmp_group['labels'] = list(qn['label'])
                 tmp_group['sequence'] = sequence
                 sequence += 1
                 continue
@@ -310,21 +1437,16 @@ class KoboExtractor:
             sequence += 1
             if 'label' in qn:
                 new_question['label'] = qn['label'][0]
+                new_question['labels'] = list(qn['label'])
             if 'select_from_list_name' in qn:
                 new_question['list_name'] = qn['select_from_list_name']
             
             if unpack_multiples and qn['type'] == 'select_multiple':
                 list_name = qn['select_from_list_name']
-                new_choices = {}
-                sorted_choices = sorted(choices[list_name].items(),
-                                        key=lambda choice: choice[1]['sequence'])
-                for choice in sorted_choices:
-                    new_choices[choice[0]] = {}
-                    new_choices[choice[0]]['label'] = choice[1]['label']
-                    new_choices[choice[0]]['type'] = 'select_multiple_option'
-                    new_choices[choice[0]]['sequence'] = sequence
-                    sequence += 1
-                new_question['choices'] = new_choices
+                if list_name not in ordered_choices:
+                    ordered_choices[list_name] = _order_choices(choice_lists[list_name])
+                new_question['choices'] = UnpackedChoices(ordered_choices[list_name], sequence)
+                sequence += len(new_question['choices'])
             
             if '_or_other' in qn and qn['_or_other']:
                 # TODO: This needs some testing
@@ -340,6 +1462,52 @@ class KoboExtractor:
         return root_group
     
     
+    def get_schema(self,
+                   asset,            # type: Dict[str, Any]
+                   unpack_multiples, # type: bool
+                   ):
+        # type: (...) -> Dict[str, Any]
+        """Gets the choices and questions of a survey, reusing earlier results.
+        
+        Builds the choices and questions of a survey as ``get_choices()`` and
+        ``get_questions()`` do, but only once per asset version: later calls
+        for the same asset UID, version and ``unpack_multiples`` return the
+        same, cached dict. The returned dicts must therefore not be modified.
+        
+        Args:
+            asset: A dict as returned by ``get_asset()``.
+            unpack_multiples: Passed on to ``get_questions()``.
+        
+        Returns:
+            A dict of the form::
+            
+                {
+                    'choices': CHOICE_LISTS,
+                    'questions': QUESTIONS,
+                    'languages': LANGUAGES
+                }
+            
+            where CHOICE_LISTS is a dict as returned by ``get_choices()``,
+            QUESTIONS is a dict as returned by ``get_questions()`` and
+            LANGUAGES is a list as returned by ``get_languages()``. The labels
+            of all languages are included, so a single schema serves
+            ``label_result()`` in any language.
+        """
+        key = (asset.get('uid'), asset.get('version_id'), unpack_multiples)
+        if key[0] is not None and key in self._schemas:
+            return self._schemas[key]
+        
+        choice_lists = self.get_choices(asset)
+        schema = {
+            'choices': choice_lists,
+            'questions': self.get_questions(asset, unpack_multiples, choice_lists),
+            'languages': self.get_languages(asset)
+        }
+        if key[0] is not None:
+            self._schemas[key] = schema
+        return schema
+    
+    
     def sort_results_by_time(self,
                              unsorted_results,  # type: List[Dict[str, Any]]
                              reverse=False,     # type: bool
@@ -380,6 +1548,9 @@ class KoboExtractor:
                      choice_lists,      # type: Dict[str, Dict[str, str]]
                      questions,         # type: Dict[str, Dict[str, Any]]
                      unpack_multiples,  # type: bool
+                     lazy=False,        # type: bool
+                     language=None,     # type: Union[None, int, str, List[Union[int, str]]]
+                     languages=None,    # type: Optional[List[Optional[str]]]
                      ):
         # type: (...) -> Dict[str, Any]
         """Adds labels for questions and answers to a response.
@@ -431,6 +1602,20 @@ class KoboExtractor:
             unpack_multiples: If True, the corresponding choices from
                 ``get_choices()`` are added as subsequent questions following a
                 multiple choice question (type 'select_multiple').
+            lazy: If True, 'results' is a ``LazyLabeledResults`` mapping which
+                labels each question only when it is accessed, instead of a
+                dict with all questions labeled up front. Useful when only a
+                few questions of each response are read. Default: False.
+            language: The language of the labels, either as a name or as an
+                index in the list returned by ``get_languages(asset)``. A list
+                of languages labels the response once for each of them.
+                Default: None, i.e. the survey's default language.
+            languages: List of languages as returned by
+                ``get_languages(asset)`` or in ``get_schema(asset)``. Required
+                to choose a language by name.
+        
+        Raises:
+            ValueError: ``language`` is not a language of the survey.
         
         Returns:
             A dict of the form::
@@ -481,133 +1666,203 @@ class KoboExtractor:
             () denote optional parts, depending on how deep the groups are
             nested. QUESTION_SEQUENCE reflects the order of the questions (and
             choices) in the survey.
-        """
-        def label_question(group_codes, question_code, value, questions, choice_lists, unpack_multiples):
-            def unlabeled_question(question_code, value):
-                return {
-                    'label': question_code,
-                    'answer_code': value,
-                    'answer_label': value
-                }
-            
-            # Add and label the question
-            result_qn = {}
-            tmp_qn = questions
-            for group_code in group_codes:
-                if group_code in tmp_qn['groups']:
-                    tmp_qn = tmp_qn['groups'][group_code]
-                else:
-                    # cannot find this question
-                    return unlabeled_question(question_code, value)
-            if not ('questions' in tmp_qn and question_code in tmp_qn['questions']):
-                # cannot find this question
-                    return unlabeled_question(question_code, value)
-            
-            tmp_qn = tmp_qn['questions'][question_code]
             
-            if 'label' not in tmp_qn:
-                # cannot label this question and answer
-                return unlabeled_question(question_code, value)
+            With ``lazy=True``, 'results' is a read-only ``LazyLabeledResults``
+            mapping with the same keys and values, and repeat groups map each
+            index to a nested ``LazyLabeledResults``. 'meta' is a read-only
+            mapping as well, which reads the metadata from the response on
+            access.
             
-            result_qn['sequence'] = tmp_qn['sequence']
-            result_qn['label'] = tmp_qn['label']
-            result_qn['answer_code'] = value
+            If ``language`` is a list, a dict is returned instead which maps
+            each of the given languages to a labeled response as above.
+        """
+        if isinstance(language, (list, tuple)):
+            return {lang: self.label_result(unlabeled_result, choice_lists,
+                                            questions, unpack_multiples,
+                                            lazy=lazy, language=lang,
+                                            languages=languages)
+                    for lang in language}
+        return _label_result(unlabeled_result, choice_lists, questions,
+                             unpack_multiples, lazy,
+                             _language_index(questions, language, languages))
+    
+    
+    def iter_labeled_data(self,
+                          asset_uid,             # type: str
+                          choice_lists,          # type: Dict[str, Dict[str, Any]]
+                          questions,             # type: Dict[str, Dict[str, Any]]
+                          unpack_multiples,      # type: bool
+                          query=None,            # type: str
+                          submitted_after=None,  # type: str
+                          language=None,         # type: Union[None, int, str, List[Union[int, str]]]
+                          languages=None,        # type: Optional[List[Optional[str]]]
+                          serializer=None,       # type: Optional[Callable[[Dict[str, Any]], Any]]
+                          page_size=5000,        # type: int
+                          chunk_size=200,        # type: int
+                          processes=None,        # type: Optional[int]
+                          queue_size=4,          # type: int
+                          request_timeout=60,    # type: float
+                          ):
+        # type: (...) -> Iterator[Any]
+        """Downloads, decodes and labels the responses of an asset in parallel.
+        
+        Runs a pipeline of three stages, so that downloading the next page of
+        responses, decoding it and labeling the previous ones happen at the same
+        time:
+        
+        1. A thread downloads the pages of ``get_data()`` one after the other,
+           until as many responses as given by its 'count' have been read.
+        2. A thread decodes each page and splits it into chunks of responses.
+        3. A pool of processes labels the chunks as ``label_result()`` does, and
+           optionally serializes each labeled response.
+        
+        The stages are connected by queues of at most ``queue_size`` items, and at
+        most ``processes * queue_size`` chunks are labeled at a time, so a slow
+        consumer pauses the download instead of filling up the memory. The
+        labeled responses are yielded in the order of the pages.
+        
+        Example::
             
-            if tmp_qn['type'] == 'select_one':
+            import json
+            from koboextractor import KoboExtractor
+            kobo = KoboExtractor(KOBO_TOKEN, 'https://kf.kobotoolbox.org/api/v2')
+            schema = kobo.get_schema(kobo.get_asset(asset_uid), unpack_multiples=True)
+            with open('labeled.jsonl', 'w') as f:
+                for line in kobo.iter_labeled_data(asset_uid, schema['choices'],
+                                                   schema['questions'], True,
+                                                   serializer=json.dumps):
+                    f.write(line + '\n')
+        
+        Args:
+            asset_uid: Unique ID of the asset.
+            choice_lists: Dict of choice lists as returned by
+                ``get_choices(asset)``.
+            questions: Dict of questions as returned by
+                ``get_questions(asset)``.
+            unpack_multiples: Passed on to ``label_result()``.
+            query: Passed on to ``get_data()``.
+            submitted_after: Passed on to ``get_data()``.
+            language: Passed on to ``label_result()``. With a list of
+                languages, each response is labeled in all of them from a
+                single download.
+            languages: Passed on to ``label_result()``.
+            serializer: Optional function applied to each labeled response in the
+                labeling processes, e.g. ``json.dumps``. It must be picklable, i.e.
+                defined at the top level of a module.
+            page_size: Number of responses downloaded per request (default: 5000).
+            chunk_size: Number of responses sent to a labeling process at a time
+                (default: 200).
+            processes: Number of labeling processes (default: the number of CPUs).
+            queue_size: Maximum number of pages and of chunks waiting between two
+                stages (default: 4).
+            request_timeout: Seconds to wait for the server to send data before
+                a download fails (default: 60). This also limits how long
+                stopping the pipeline early can take.
+        
+        Raises:
+            concurrent.futures.process.BrokenProcessPool: A labeling process
+                died, e.g. because it ran out of memory.
+        
+        Yields:
+            Each labeled response as returned by ``label_result()``, i.e. a
+            dict mapping each language to the labeled response if
+            ``language`` is a list, or the result of ``serializer`` for it.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        if isinstance(language, (list, tuple)):
+            # resolved here, so that unknown languages fail right away
+            language = [(lang, _language_index(questions, lang, languages))
+                        for lang in language]
+        else:
+            language = _language_index(questions, language, languages)
+        processes = processes or os.cpu_count() or 1
+        max_pending = processes * queue_size
+        headers = self._headers()
+        pages = queue.Queue(maxsize=queue_size)
+        chunks = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+        done = object()
+        
+        def fetch():
+            try:
+                # The first page tells how many responses there are, and how
+                # many the server returns per page, which may be fewer than
+                # page_size
+                url = self._data_url(asset_uid, query, None, page_size, submitted_after)
+                if self.debug: print(f'KoboExtractor.iter_labeled_data: Calling {url}')
+                response = _requests().get(url, headers=headers, timeout=request_timeout)
+                response.raise_for_status()
+                data = response.json()
+                count, step = data['count'], len(data['results']) or page_size
+                if not _put(pages, data['results'], stop):
+                    return
+                for start in range(step, count, step):
+                    url = self._data_url(asset_uid, query, start, step, submitted_after)
+                    if self.debug: print(f'KoboExtractor.iter_labeled_data: Calling {url}')
+                    response = _requests().get(url, headers=headers, timeout=request_timeout)
+                    response.raise_for_status()
+                    if not _put(pages, response.content, stop):
+                        return
+                _put(pages, done, stop)
+            except Exception as e:
+                _put(pages, e, stop)
+        
+        def decode():
+            while not stop.is_set():
                 try:
-                    # get answer label from choice list
-                    list_name = tmp_qn['list_name']
-                    result_qn['answer_label'] = choice_lists[list_name][value]['label']
-                except KeyError:
-                    # Cannot label this answer
-                    result_qn['answer_label'] = value
-            elif tmp_qn['type'] == 'select_multiple':
-                list_name = tmp_qn['list_name']
+                    page = pages.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if page is done or isinstance(page, Exception):
+                    _put(chunks, page, stop)
+                    return
                 try:
-                    # get individual answer labels from choice list and
-                    # concatenate them into this question's answer label
-                    answer_label = ''
-                    for split_answer_code in value.split():
-                        answer_label = answer_label + choice_lists[list_name][split_answer_code]['label'] + ';'
-                    result_qn['answer_label'] = answer_label
-                except KeyError:
-                    # Cannot label this answer
-                    result_qn['answer_label'] = value
-                if unpack_multiples: # TODO: Should this really be optional?
-                    # unpack the individual choices
-                    result_qn['choices'] = {}
-                    for choice_code, choice_dict in choice_lists[list_name].items():
-                        result_qn['choices'][choice_code] = {}
-                        result_qn['choices'][choice_code]['sequence'] = tmp_qn['choices'][choice_code]['sequence']
-                        result_qn['choices'][choice_code]['label'] = choice_dict['label']
-                        result_qn['choices'][choice_code]['answer_code'] = (int) (choice_code in value.split())
-                        result_qn['choices'][choice_code]['answer_label'] = 'Yes' if choice_code in value.split() else 'No'
-            else:
-                # no special treatment for simple types of questions
-                result_qn['answer_label'] = value
-            return result_qn
-        
-        def label_repeat_group(outer_group_codes, repeat_list, questions, choice_lists, unpack_multiples):
-            repeat_group = {}
-            i = 0
-            for repeat_set in repeat_list:
-                repeat_group[i] = {}
-                for key, value in repeat_set.items():
-                    inner_group_codes = key.split('/')
-                    for outer_group_code in outer_group_codes:
-                        inner_group_codes.remove(outer_group_code)
-                    
-                    if isinstance(value, list):
-                        # repeat group
-                        repeat_group[i]['/'.join(inner_group_codes)] = label_repeat_group(outer_group_codes + inner_group_codes, value, questions, choice_lists, unpack_multiples)
-                    else:
-                        # (QUESTION_GROUP(S)/)QUESTION_CODE type
-                        question_code = inner_group_codes.pop()
-                        repeat_group[i]['/'.join(inner_group_codes+[question_code])] = label_question(outer_group_codes + inner_group_codes, question_code, value, questions, choice_lists, unpack_multiples)
-                i += 1
-            return repeat_group
-        
-        ################################
-        meta_keys_start = (
-            '_',
-            'meta/',
-            'formhub/',
-            'simserial',
-            'phonenumber',
-            'start',
-            'end',
-            'today',
-            'username',
-            'deviceid',
-            'subscriberid'
-        )
-        
-        meta = {}
-        results = {}
-        for key, value in unlabeled_result.items():
-            # there are various keys within an unlabeled_result dict, and not
-            # all of them belong to survey questions:
-            # key starts with meta_keys_start -> metadata
-            # otherwise, key points to a list -> (GROUP_CODE(S)/)REPEAT_GROUP_CODE type
-            # otherwise -> (GROUP_CODE(S)/)/QUESTION_CODE type (number of '/' -> number of nested groups)
-            # otherwise -> groupless question
-            if key.startswith(meta_keys_start):
-                meta[key] = value
-                continue
-            
-            if isinstance(value, list):
-                # repeat group
-                group_codes = key.split('/')
-                results['/'.join(group_codes)] = label_repeat_group(group_codes, value, questions, choice_lists, unpack_multiples)
-            
-            else:
-                # (GROUP_CODE(S)/)/QUESTION_CODE type (number of '/' -> number of nested groups)
-                group_codes = key.split('/')
-                question_code = group_codes.pop()
-                results[key] = label_question(group_codes, question_code, value, questions, choice_lists, unpack_multiples)
+                    # the first page has already been decoded by fetch()
+                    results = page if isinstance(page, list) else json.loads(page)['results']
+                except Exception as e:
+                    _put(chunks, e, stop)
+                    return
+                for i in range(0, len(results), chunk_size):
+                    if not _put(chunks, results[i:i + chunk_size], stop):
+                        return
         
-        return {
-            'meta': meta,
-            'results': results
-        }
+        # Unlike multiprocessing.Pool, the executor fails the pending chunks
+        # if a labeling process dies (e.g. killed for running out of memory)
+        # instead of waiting for them forever
+        pool = ProcessPoolExecutor(processes, initializer=_init_label_worker,
+                                   initargs=(choice_lists, questions, unpack_multiples,
+                                             language, serializer))
+        stages = [threading.Thread(target=fetch, daemon=True),
+                  threading.Thread(target=decode, daemon=True)]
+        pending = deque()
+        finished = False
+        try:
+            for stage in stages:
+                stage.start()
+            while not finished or pending:
+                # Keep the labeling processes busy, but only up to a limit
+                while not finished and len(pending) < max_pending:
+                    try:
+                        chunk = chunks.get(timeout=0.1 if pending else None)
+                    except queue.Empty:
+                        break
+                    if chunk is done:
+                        finished = True
+                    elif isinstance(chunk, Exception):
+                        raise chunk
+                    else:
+                        pending.append(pool.submit(_label_chunk, chunk))
+                # Hand out the oldest chunk once it is labeled, to keep the order
+                if pending and (finished or len(pending) >= max_pending
+                                or pending[0].done()):
+                    for labeled in pending.popleft().result():
+                        yield labeled
+        finally:
+            stop.set()
+            for future in pending:
+                future.cancel()
+            pool.shutdown()
+            for stage in stages:
+                if stage.is_alive():
+                    stage.join()
     
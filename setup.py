@@ -28,5 +28,10 @@ setuptools.setup(
     install_requires=[
         'requests'
     ],
+    extras_require={
+        'xls': ['openpyxl'],
+        'msgpack': ['msgpack>=1.0'],
+        'brotli': ['brotli'],
+    },
     python_requires='>=3.6',
 )
\ No newline at end of file
@@ -0,0 +1,155 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from koboextractor import KoboExtractor
+
+
+ASSET = {
+    'uid': 'aTest',
+    'version_id': 'v1',
+    'content': {
+        'translations': ['English (en)', 'French (fr)'],
+        'choices': [
+            {'list_name': 'yes_no', 'name': 'yes', 'label': ['Yes', 'Oui']},
+            {'list_name': 'yes_no', 'name': 'no', 'label': ['No', 'Non']},
+            {'list_name': 'fruits', 'name': 'apple', 'label': ['Apple', 'Pomme']},
+            {'list_name': 'fruits', 'name': 'banana', 'label': ['Banana', 'Banane']},
+            {'list_name': 'fruits', 'name': 'cherry', 'label': ['Cherry', None]},
+        ],
+        'survey': [
+            {'type': 'start', 'name': 'start'},
+            {'type': 'select_one', 'name': 'likes_fruit',
+             'label': ['Likes fruit?', 'Aime les fruits ?'],
+             'select_from_list_name': 'yes_no'},
+            {'type': 'begin_group', 'name': 'food', 'label': ['Food', 'Nourriture']},
+            {'type': 'select_multiple', 'name': 'fruits',
+             'label': ['Fruits', 'Fruits'], 'select_from_list_name': 'fruits'},
+            {'type': 'begin_repeat', 'name': 'meals', 'label': ['Meals', 'Repas']},
+            {'type': 'text', 'name': 'dish', 'label': ['Dish', 'Plat']},
+            {'type': 'select_multiple', 'name': 'dessert',
+             'label': ['Dessert', 'Dessert'], 'select_from_list_name': 'fruits'},
+            {'type': 'end_repeat'},
+            {'type': 'end_group'},
+        ],
+    },
+}
+
+
+RESULT = {
+    '_id': 1,
+    '_uuid': 'uuid-1',
+    '_submission_time': '2020-05-15T00:17:51',
+    'start': '2020-05-15T08:07:24.705+08:00',
+    'likes_fruit': 'yes',
+    'food/fruits': 'apple cherry',
+    'food/meals': [
+        {'food/meals/dish': 'Soup', 'food/meals/dessert': 'banana'},
+        {'food/meals/dish': 'Salad'},
+    ],
+    'not_in_survey': 'x',
+}
+
+
+@pytest.fixture
+def kobo():
+    return KoboExtractor('token', 'http://kobo.invalid/api/v2')
+
+
+@pytest.fixture
+def asset():
+    return json.loads(json.dumps(ASSET))
+
+
+@pytest.fixture
+def result():
+    return json.loads(json.dumps(RESULT))
+
+
+def make_results(count):
+    return [{'_id': i, '_uuid': f'uuid-{i}', 'likes_fruit': 'yes' if i % 2 else 'no',
+             'food/fruits': 'apple banana', '_submission_time': f'2020-05-15T00:{i % 60:02d}:00'}
+            for i in range(1, count + 1)]
+
+
+class MockKobo:
+    """A local HTTP server standing in for the KoBoToolbox kpi API.
+
+    Handlers are registered per path with ``route()`` and are called with the
+    request's method, query, headers and body. They return a tuple of status
+    code, body and optionally extra headers. Bodies which are dicts or lists
+    are sent as JSON.
+    """
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _handle(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                mock.requests.append((method, url.path, dict(self.headers)))
+                handler = mock.routes.get(url.path)
+                if handler is None:
+                    status, payload, headers = 404, {'detail': 'Not found.'}, {}
+                else:
+                    response = handler(method, parse_qs(url.query), self.headers, body)
+                    status, payload = response[:2]
+                    headers = response[2] if len(response) > 2 else {}
+                if isinstance(payload, (dict, list)):
+                    payload = json.dumps(payload).encode()
+                    headers.setdefault('Content-Type', 'application/json')
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self.endpoint = f'{self.url}/api/v2'
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        args=(0.01,), daemon=True)
+        self._thread.start()
+
+    def route(self, path, handler):
+        self.routes[path] = handler
+
+    def serve_data(self, asset_uid, results, max_limit=30000):
+        """Serves ``results`` at the data endpoint, capping ``limit``."""
+        def data(method, query, headers, body):
+            start = int(query.get('start', ['0'])[0])
+            limit = min(int(query.get('limit', [str(max_limit)])[0]), max_limit)
+            return 200, {'count': len(results), 'results': results[start:start + limit]}
+        self.route(f'/api/v2/assets/{asset_uid}/data.json', data)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def server():
+    mock = MockKobo()
+    yield mock
+    mock.close()
+
+
+@pytest.fixture
+def remote_kobo(server):
+    return KoboExtractor('token', server.endpoint)
@@ -0,0 +1,77 @@
+import os
+
+from koboextractor import SubmissionDeduplicator
+
+from conftest import make_results
+
+
+def ids(results):
+    return [result['_id'] for result in results]
+
+
+def test_filter_drops_duplicates_and_keeps_changes(tmp_path):
+    results = make_results(5)
+    with SubmissionDeduplicator(str(tmp_path / 'seen.sqlite'), batch_size=2) as seen:
+        assert ids(seen.filter(results + results[:2])) == [1, 2, 3, 4, 5]
+        assert len(seen) == 5
+        assert ids(seen.filter(results)) == []
+        results[2]['_uuid'] = 'edited'
+        results[3]['_last_edited'] = '2020-06-01T00:00:00'
+        assert ids(seen.filter(results)) == [3, 4]
+
+
+def test_index_is_kept_on_disk(tmp_path):
+    path = str(tmp_path / 'seen.sqlite')
+    with SubmissionDeduplicator(path) as seen:
+        assert ids(seen.filter(make_results(3))) == [1, 2, 3]
+    with SubmissionDeduplicator(path) as seen:
+        assert ids(seen.filter(make_results(4))) == [4]
+
+
+def test_default_index_is_a_temporary_file():
+    seen = SubmissionDeduplicator()
+    assert seen.path != ':memory:' and os.path.exists(seen.path)
+    seen.close()
+    assert not os.path.exists(seen.path)
+
+
+def test_only_handed_out_results_are_recorded():
+    with SubmissionDeduplicator() as seen:
+        filtered = seen.filter(make_results(5))
+        assert next(filtered)['_id'] == 1
+        filtered.close()
+        assert len(seen) == 1
+        assert ids(seen.filter(make_results(5))) == [2, 3, 4, 5]
+
+
+def test_results_without_id_pass_through():
+    with SubmissionDeduplicator() as seen:
+        results = [{'x': 1}, {'y': 2}, {'_uuid': 'u'}, {'_uuid': 'u'}]
+        assert list(seen.filter(results)) == results[:3]
+        assert len(seen) == 1
+
+
+def test_iter_data_pages_by_count(server, remote_kobo):
+    results = make_results(1234)
+    server.serve_data('aTest', results, max_limit=50)
+    assert list(remote_kobo.iter_data('aTest')) == results
+    assert list(remote_kobo.iter_data('aTest', page_size=100)) == results
+
+
+def test_iter_data_with_deduplicator(server, remote_kobo):
+    results = make_results(120)
+    server.serve_data('aTest', results, max_limit=50)
+    with SubmissionDeduplicator() as seen:
+        assert len(list(remote_kobo.iter_data('aTest', deduplicator=seen))) == 120
+        results.append(dict(results[0], _id=999))
+        assert ids(remote_kobo.iter_data('aTest', deduplicator=seen)) == [999]
+
+
+def test_iter_labeled_data_pages_by_count(server, remote_kobo, asset):
+    results = make_results(234)
+    server.serve_data('aTest', results, max_limit=50)
+    schema = remote_kobo.get_schema(asset, unpack_multiples=False)
+    labeled = list(remote_kobo.iter_labeled_data('aTest', schema['choices'],
+                                                 schema['questions'], False,
+                                                 page_size=100, processes=1))
+    assert [result['meta']['_id'] for result in labeled] == ids(results)
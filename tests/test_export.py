@@ -0,0 +1,116 @@
+import gzip
+import io
+import json
+import sys
+
+import pytest
+
+
+CSV = ('﻿"start";"likes_fruit";"food/fruits";"comment";"_id";"_uuid";"_index"\r\n'
+       '"2020-05-15";"yes";"apple banana";"Line one\r\nline two; with semicolon";"1";"uuid-1";"1"\r\n'
+       '"2020-05-16";"no";"";"";"2";"uuid-2";"2"\r\n')
+
+
+EXPECTED = [
+    {'start': '2020-05-15', 'likes_fruit': 'yes', 'food/fruits': 'apple banana',
+     'comment': 'Line one\r\nline two; with semicolon', '_id': 1, '_uuid': 'uuid-1'},
+    {'start': '2020-05-16', 'likes_fruit': 'no', '_id': 2, '_uuid': 'uuid-2'},
+]
+
+
+def serve_export(server, statuses, body=CSV.encode('utf-8'), headers=None):
+    """Serves an export which goes through ``statuses`` while polled."""
+    polls = []
+    created = []
+
+    def create(method, query, request_headers, payload):
+        created.append(json.loads(payload))
+        return 201, {'uid': 'eTest', 'status': 'created'}
+
+    def poll(method, query, request_headers, payload):
+        polls.append(method)
+        status = statuses[min(len(polls), len(statuses)) - 1]
+        if isinstance(status, dict):
+            return 200, status
+        return 200, {'uid': 'eTest', 'status': status, 'messages': {'error': 'boom'},
+                     'result': f'{server.url}/exports/eTest.csv'}
+
+    def download(method, query, request_headers, payload):
+        return 200, body, dict(headers or {'Content-Type': 'text/csv'})
+
+    server.route('/api/v2/assets/aTest/exports/', create)
+    server.route('/api/v2/assets/aTest/exports/eTest.json', poll)
+    server.route('/exports/eTest.csv', download)
+    return created, polls
+
+
+def test_iter_export_data_streams_csv(server, remote_kobo):
+    created, polls = serve_export(server, ['created', 'processing', 'complete'])
+    results = list(remote_kobo.iter_export_data('aTest', poll_interval=0.01, chunk_size=16))
+    assert results == EXPECTED
+    assert created == [{'type': 'csv', 'lang': '_xml', 'group_sep': '/',
+                        'hierarchy_in_labels': 'true',
+                        'fields_from_all_versions': 'true',
+                        'multiple_select': 'summary'}]
+    assert len(polls) == 3
+
+
+def test_iter_export_data_decodes_gzip(server, remote_kobo):
+    serve_export(server, ['complete'], body=gzip.compress(CSV.encode('utf-8')),
+                 headers={'Content-Type': 'text/csv', 'Content-Encoding': 'gzip'})
+    assert list(remote_kobo.iter_export_data('aTest', poll_interval=0.01)) == EXPECTED
+
+
+def test_wait_for_export_backs_off(server, remote_kobo, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr('koboextractor.time.sleep', sleeps.append)
+    serve_export(server, ['processing'] * 5 + ['complete'])
+    export = remote_kobo.wait_for_export('aTest', 'eTest', poll_interval=1,
+                                         max_poll_interval=3)
+    assert export['status'] == 'complete'
+    assert sleeps == [1, 1.5, 2.25, 3, 3]
+
+
+def test_wait_for_export_raises_on_error(server, remote_kobo):
+    serve_export(server, ['processing', 'error'])
+    with pytest.raises(RuntimeError, match='boom'):
+        remote_kobo.wait_for_export('aTest', 'eTest', poll_interval=0.01)
+
+
+def test_wait_for_export_raises_without_status(server, remote_kobo):
+    serve_export(server, [{'detail': 'Not found.'}])
+    with pytest.raises(RuntimeError, match='Not found'):
+        remote_kobo.wait_for_export('aTest', 'eTest', poll_interval=0.01)
+
+
+def test_wait_for_export_times_out(server, remote_kobo):
+    serve_export(server, ['processing'])
+    with pytest.raises(TimeoutError):
+        remote_kobo.wait_for_export('aTest', 'eTest', poll_interval=0.05, timeout=0.1)
+
+
+def test_iter_export_data_reads_xls(server, remote_kobo):
+    openpyxl = pytest.importorskip('openpyxl')
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['start', 'likes_fruit', 'food/fruits', 'comment', '_id', '_uuid', '_index'])
+    sheet.append(['2020-05-15', 'yes', 'apple banana', 'Line one\nline two; with semicolon',
+                  1, 'uuid-1', 1])
+    sheet.append(['2020-05-16', 'no', None, None, 2, 'uuid-2', 2])
+    body = io.BytesIO()
+    workbook.save(body)
+    created, _ = serve_export(server, ['complete'], body=body.getvalue(), headers={
+        'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'})
+    results = list(remote_kobo.iter_export_data('aTest', 'xls', poll_interval=0.01,
+                                                chunk_size=64))
+    assert results == [dict(EXPECTED[0], comment='Line one\nline two; with semicolon'),
+                       EXPECTED[1]]
+    assert created[0]['type'] == 'xls'
+
+
+def test_iter_export_data_asks_for_openpyxl(server, remote_kobo, monkeypatch):
+    created, _ = serve_export(server, ['complete'])
+    monkeypatch.setitem(sys.modules, 'openpyxl', None)
+    with pytest.raises(ImportError, match=r'koboextractor\[xls\]'):
+        next(remote_kobo.iter_export_data('aTest', 'xls', poll_interval=0.01))
+    assert created == []
@@ -0,0 +1,73 @@
+from collections.abc import Mapping
+
+import pytest
+
+from koboextractor import LazyLabeledResults
+
+
+def test_label_result(kobo, asset, result):
+    choices = kobo.get_choices(asset)
+    questions = kobo.get_questions(asset, unpack_multiples=True)
+    labeled = kobo.label_result(result, choices, questions, True)
+
+    assert labeled['meta'] == {key: result[key] for key in
+                               ('_id', '_uuid', '_submission_time', 'start')}
+    results = labeled['results']
+    assert results['likes_fruit']['answer_label'] == 'Yes'
+    assert results['food/fruits']['answer_label'] == 'Apple;Cherry;'
+    assert {code: choice['answer_code'] for code, choice
+            in results['food/fruits']['choices'].items()} == {
+                'apple': 1, 'banana': 0, 'cherry': 1}
+    assert results['food/meals'][0]['dish']['answer_label'] == 'Soup'
+    assert results['food/meals'][0]['dessert']['answer_label'] == 'Banana;'
+    assert results['food/meals'][1]['dish']['label'] == 'Dish'
+    assert results['not_in_survey'] == {'label': 'not_in_survey',
+                                        'answer_code': 'x',
+                                        'answer_label': 'x'}
+
+
+def test_lazy_label_result_matches_eager(kobo, asset, result):
+    choices = kobo.get_choices(asset)
+    questions = kobo.get_questions(asset, unpack_multiples=True)
+    eager = kobo.label_result(result, choices, questions, True)
+    lazy = kobo.label_result(result, choices, questions, True, lazy=True)
+
+    assert isinstance(lazy['results'], LazyLabeledResults)
+    assert lazy['meta'] == eager['meta']
+    assert lazy['results'].to_dict() == eager['results']
+    assert set(lazy['results']) == set(eager['results'])
+    assert len(lazy['results']) == len(eager['results'])
+
+
+def test_lazy_label_result_labels_on_access(kobo, asset, result):
+    choices = kobo.get_choices(asset)
+    questions = kobo.get_questions(asset, unpack_multiples=True)
+    results = kobo.label_result(result, choices, questions, True, lazy=True)['results']
+
+    assert results._cache == {}
+    first = results['likes_fruit']
+    assert list(results._cache) == ['likes_fruit']
+    assert results['likes_fruit'] is first
+
+    meals = results['food/meals']
+    assert isinstance(meals[1], Mapping)
+    assert meals[1]['dish']['answer_label'] == 'Salad'
+    assert meals[0]._cache.keys() == set()
+
+
+def test_lazy_label_result_reads_single_questions_directly(kobo, asset, result):
+    choices = kobo.get_choices(asset)
+    questions = kobo.get_questions(asset, unpack_multiples=True)
+    labeled = kobo.label_result(result, choices, questions, True, lazy=True)
+    results = labeled['results']
+
+    assert results['food/fruits']['answer_label'] == 'Apple;Cherry;'
+    assert results._index is None
+    assert '_id' not in results
+    with pytest.raises(KeyError):
+        results['_uuid']
+    assert labeled['meta']['_id'] == 1
+    with pytest.raises(KeyError):
+        labeled['meta']['likes_fruit']
+    assert dict(labeled['meta']) == {key: result[key] for key in
+                                     ('_id', '_uuid', '_submission_time', 'start')}
@@ -0,0 +1,46 @@
+import pytest
+
+
+def label(kobo, asset, result, **kwargs):
+    schema = kobo.get_schema(asset, unpack_multiples=True)
+    return kobo.label_result(result, schema['choices'], schema['questions'],
+                             True, **kwargs)
+
+
+def test_get_languages(kobo, asset):
+    assert kobo.get_languages(asset) == ['English (en)', 'French (fr)']
+    del asset['content']['translations']
+    assert kobo.get_languages(asset) == [None]
+
+
+def test_questions_keep_documented_shape(kobo, asset):
+    assert set(kobo.get_questions(asset, True)) == {'questions', 'groups'}
+    assert kobo.get_schema(asset, True)['languages'] == ['English (en)', 'French (fr)']
+
+
+def test_label_result_in_other_language(kobo, asset, result):
+    languages = kobo.get_languages(asset)
+    by_name = label(kobo, asset, result, language='French (fr)', languages=languages)
+    results = by_name['results']
+    assert results['likes_fruit']['label'] == 'Aime les fruits ?'
+    assert results['likes_fruit']['answer_label'] == 'Oui'
+    # cherry has no French label and falls back to the default language
+    assert results['food/fruits']['answer_label'] == 'Pomme;Cherry;'
+    assert results['food/meals'][0]['dish']['label'] == 'Plat'
+    assert label(kobo, asset, result, language=1) == by_name
+    assert label(kobo, asset, result, language=1, lazy=True)['results'].to_dict() == results
+
+
+def test_label_result_in_several_languages(kobo, asset, result):
+    languages = kobo.get_languages(asset)
+    labeled = label(kobo, asset, result, language=languages, languages=languages)
+    assert labeled['English (en)'] == label(kobo, asset, result)
+    assert labeled['French (fr)'] == label(kobo, asset, result, language=1)
+
+
+@pytest.mark.parametrize('language', [-1, 2, 'German (de)'])
+def test_label_result_rejects_unknown_languages(kobo, asset, result, language):
+    with pytest.raises(ValueError):
+        label(kobo, asset, result, language=language, languages=kobo.get_languages(asset))
+    with pytest.raises(ValueError):
+        label(kobo, asset, result, language=language)
@@ -0,0 +1,47 @@
+import io
+import json
+
+import pytest
+import requests
+
+from koboextractor import iter_packed_results, pack_results, unpack_results
+
+from conftest import RESULT, make_results
+
+pytest.importorskip('msgpack')
+
+
+def test_pack_results_round_trip():
+    results = make_results(50) + [RESULT, {'_id': 51, 'a': 1, 'b': True, 'c': 1.0,
+                                           'd': None, 'e': {'x': [1, 'y']}},
+                                   {'_id': 52, 'a': True, 'b': 1, 'c': 0.0, 'd': -0.0}]
+    unpacked = unpack_results(pack_results(results))
+    assert unpacked == results
+    assert [list(result) for result in unpacked] == [list(result) for result in results]
+    assert [type(value) for value in unpacked[-2].values()] == [
+        int, int, bool, float, type(None), dict]
+    assert [repr(value) for value in unpacked[-1].values()] == ['52', 'True', '1', '0.0', '-0.0']
+
+
+def test_pack_results_is_compact():
+    results = make_results(1000)
+    assert len(pack_results(results)) < len(json.dumps(results)) / 3
+
+
+def test_pack_results_of_nothing():
+    assert unpack_results(pack_results([])) == []
+
+
+def test_iter_packed_results_reads_all_batches():
+    first, second = make_results(10), make_results(3)
+    packed = io.BytesIO(pack_results(first) + pack_results(second))
+    assert list(iter_packed_results(packed)) == first + second
+
+
+def test_requests_ask_for_compression(server, remote_kobo):
+    server.serve_data('aTest', make_results(1))
+    remote_kobo.get_data('aTest')
+    headers = server.requests[-1][2]
+    assert headers['Accept-Encoding'] == requests.utils.default_headers()['Accept-Encoding']
+    assert 'gzip' in headers['Accept-Encoding']
+    assert headers['Authorization'] == 'Token token'
@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+import requests
+
+from conftest import make_results
+
+
+def die(labeled):
+    # stands in for a labeling process killed by the OOM killer
+    os._exit(1)
+
+
+def schema_of(kobo, asset):
+    schema = kobo.get_schema(asset, unpack_multiples=True)
+    return schema['choices'], schema['questions']
+
+
+def test_iter_labeled_data_keeps_order(server, remote_kobo, asset):
+    results = make_results(1234)
+    server.serve_data('aTest', results)
+    choices, questions = schema_of(remote_kobo, asset)
+    labeled = list(remote_kobo.iter_labeled_data(
+        'aTest', choices, questions, True, serializer=json.dumps,
+        page_size=100, chunk_size=30, processes=2, queue_size=2))
+    assert labeled == [json.dumps(remote_kobo.label_result(result, choices, questions, True))
+                       for result in results]
+
+
+def test_iter_labeled_data_in_other_language(server, remote_kobo, asset):
+    results = make_results(10)
+    server.serve_data('aTest', results)
+    choices, questions = schema_of(remote_kobo, asset)
+    labeled = list(remote_kobo.iter_labeled_data(
+        'aTest', choices, questions, True, language='French (fr)',
+        languages=remote_kobo.get_languages(asset), processes=1))
+    assert labeled[0]['results']['likes_fruit']['answer_label'] == 'Oui'
+
+
+def test_iter_labeled_data_in_several_languages(server, remote_kobo, asset):
+    results = make_results(30)
+    server.serve_data('aTest', results)
+    schema = remote_kobo.get_schema(asset, unpack_multiples=True)
+    labeled = list(remote_kobo.iter_labeled_data(
+        'aTest', schema['choices'], schema['questions'], True,
+        language=schema['languages'], languages=schema['languages'],
+        chunk_size=7, processes=2))
+    assert labeled == [remote_kobo.label_result(result, schema['choices'],
+                                                schema['questions'], True,
+                                                language=schema['languages'],
+                                                languages=schema['languages'])
+                       for result in results]
+    assert labeled[0]['French (fr)']['results']['likes_fruit']['answer_label'] == 'Oui'
+    assert labeled[0]['English (en)']['results']['likes_fruit']['answer_label'] == 'Yes'
+    assert len([r for r in server.requests if r[1].endswith('data.json')]) == 1
+
+
+def test_iter_labeled_data_rejects_unknown_languages(server, remote_kobo, asset):
+    schema = remote_kobo.get_schema(asset, unpack_multiples=True)
+    with pytest.raises(ValueError, match='German'):
+        next(remote_kobo.iter_labeled_data(
+            'aTest', schema['choices'], schema['questions'], True,
+            language=['French (fr)', 'German (de)'], languages=schema['languages']))
+
+
+def test_iter_labeled_data_stops_early(server, remote_kobo, asset):
+    server.serve_data('aTest', make_results(5000))
+    choices, questions = schema_of(remote_kobo, asset)
+    threads = threading.active_count()
+    labeled = remote_kobo.iter_labeled_data('aTest', choices, questions, True,
+                                            page_size=50, processes=2, queue_size=1)
+    assert next(labeled)['meta']['_id'] == 1
+    labeled.close()
+    assert threading.active_count() == threads
+    # backpressure: far from all pages were downloaded
+    assert len([r for r in server.requests if r[1].endswith('data.json')]) < 20
+
+
+def test_iter_labeled_data_raises_download_errors(server, remote_kobo, asset):
+    choices, questions = schema_of(remote_kobo, asset)
+    with pytest.raises(requests.HTTPError):
+        list(remote_kobo.iter_labeled_data('aMissing', choices, questions, True,
+                                           processes=1))
+
+
+def test_iter_labeled_data_times_out(server, remote_kobo, asset):
+    def stalled(method, query, headers, body):
+        time.sleep(1)
+        return 200, {'count': 0, 'results': []}
+    server.route('/api/v2/assets/aTest/data.json', stalled)
+    choices, questions = schema_of(remote_kobo, asset)
+    with pytest.raises(requests.Timeout):
+        list(remote_kobo.iter_labeled_data('aTest', choices, questions, True,
+                                           processes=1, request_timeout=0.2))
+
+
+def test_iter_labeled_data_stops_stages_if_pool_fails(server, remote_kobo, asset, monkeypatch):
+    def broken_pool(*args, **kwargs):
+        raise OSError('no processes')
+    monkeypatch.setattr('concurrent.futures.ProcessPoolExecutor', broken_pool)
+    server.serve_data('aTest', make_results(100))
+    choices, questions = schema_of(remote_kobo, asset)
+    threads = threading.active_count()
+    with pytest.raises(OSError):
+        list(remote_kobo.iter_labeled_data('aTest', choices, questions, True,
+                                           page_size=10, queue_size=1))
+    assert threading.active_count() == threads
+
+
+def test_iter_labeled_data_fails_if_a_worker_dies(server, remote_kobo, asset):
+    server.serve_data('aTest', make_results(100))
+    choices, questions = schema_of(remote_kobo, asset)
+    threads = threading.active_count()
+    with pytest.raises(BrokenProcessPool):
+        list(remote_kobo.iter_labeled_data('aTest', choices, questions, True,
+                                           serializer=die, chunk_size=10,
+                                           processes=2))
+    assert threading.active_count() == threads
@@ -0,0 +1,79 @@
+import json
+import pickle
+
+import pytest
+
+from koboextractor import UnpackedChoices
+
+
+def test_get_choices(kobo, asset):
+    choices = kobo.get_choices(asset)
+    assert list(choices) == ['yes_no', 'fruits']
+    assert choices['fruits']['banana'] == {'label': 'Banana',
+                                           'labels': ['Banana', 'Banane'],
+                                           'sequence': 3}
+
+
+def test_get_questions(kobo, asset):
+    questions = kobo.get_questions(asset, unpack_multiples=False)
+    assert questions['questions']['likes_fruit']['list_name'] == 'yes_no'
+    food = questions['groups']['food']
+    assert food['repeat'] is False
+    assert food['groups']['meals']['repeat'] is True
+    assert 'choices' not in food['questions']['fruits']
+
+
+def test_unpacked_choices_are_ordered_and_numbered(kobo, asset):
+    questions = kobo.get_questions(asset, unpack_multiples=True)
+    fruits = questions['groups']['food']['questions']['fruits']
+    assert isinstance(fruits['choices'], UnpackedChoices)
+    assert list(fruits['choices']) == ['apple', 'banana', 'cherry']
+    assert fruits['choices']['cherry'] == {'label': 'Cherry',
+                                           'labels': ('Cherry', None),
+                                           'type': 'select_multiple_option',
+                                           'sequence': fruits['sequence'] + 3}
+    # the repeat group follows the three choices
+    meals = questions['groups']['food']['groups']['meals']
+    assert meals['sequence'] == fruits['sequence'] + 4
+
+
+def test_unpacked_choices_are_shared_and_read_only(kobo, asset):
+    questions = kobo.get_questions(asset, unpack_multiples=True)
+    fruits = questions['groups']['food']['questions']['fruits']['choices']
+    dessert = questions['groups']['food']['groups']['meals']['questions']['dessert']['choices']
+    assert fruits._choices is dessert._choices
+    assert dessert.start == fruits.start + 6
+    with pytest.raises(TypeError):
+        fruits['apple'] = {}
+
+
+def test_unpacked_choices_can_be_pickled(kobo, asset):
+    questions = kobo.get_questions(asset, unpack_multiples=True)
+    assert pickle.loads(pickle.dumps(questions)) == questions
+
+
+def test_get_schema_is_cached(kobo, asset):
+    schema = kobo.get_schema(asset, unpack_multiples=True)
+    assert kobo.get_schema(asset, unpack_multiples=True) is schema
+    assert kobo.get_schema(asset, unpack_multiples=False) is not schema
+    assert schema['questions'] == kobo.get_questions(asset, True)
+
+
+def test_unpacked_choice_is_read_only(kobo, asset):
+    questions = kobo.get_questions(asset, unpack_multiples=True)
+    choices = questions['groups']['food']['questions']['fruits']['choices']
+    with pytest.raises(TypeError):
+        choices['apple']['label'] = 'Pear'
+    assert choices['apple']['label'] == 'Apple'
+
+
+def test_unpacked_choices_to_dict(kobo, asset):
+    questions = kobo.get_questions(asset, unpack_multiples=True)
+    fruits = questions['groups']['food']['questions']['fruits']
+    choices = fruits['choices'].to_dict()
+    assert type(choices) is dict and type(choices['banana']) is dict
+    assert choices['banana'] == {'label': 'Banana', 'labels': ['Banana', 'Banane'],
+                                 'type': 'select_multiple_option',
+                                 'sequence': fruits['sequence'] + 2}
+    dumped = json.loads(json.dumps(questions, default=UnpackedChoices.to_dict))
+    assert dumped['groups']['food']['questions']['fruits']['choices'] == choices
@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from koboextractor import UnpackedChoices, load_schema, save_schema
+
+
+def test_schema_round_trip(kobo, asset, result, tmp_path):
+    path = str(tmp_path / 'schema.json')
+    schema = kobo.get_schema(asset, unpack_multiples=True)
+    save_schema(schema, path)
+    loaded = load_schema(path)
+
+    assert loaded == schema
+    assert (kobo.label_result(result, loaded['choices'], loaded['questions'], True,
+                              language='French (fr)', languages=loaded['languages'])
+            == kobo.label_result(result, schema['choices'], schema['questions'], True,
+                                 language=1))
+
+
+def test_snapshot_stores_each_choice_list_once(kobo, asset, tmp_path):
+    path = str(tmp_path / 'schema.json')
+    save_schema(kobo.get_schema(asset, unpack_multiples=True), path)
+    with open(path) as f:
+        snapshot = json.load(f)
+    food = snapshot['questions']['groups']['food']
+    assert isinstance(food['questions']['fruits']['choices'], int)
+    assert os.path.getsize(path) < 2 * len(json.dumps(asset))
+
+    loaded = load_schema(path)
+    fruits = loaded['questions']['groups']['food']['questions']['fruits']['choices']
+    dessert = loaded['questions']['groups']['food']['groups']['meals']['questions']['dessert']['choices']
+    assert isinstance(fruits, UnpackedChoices)
+    assert fruits._choices is dessert._choices
+
+
+def test_load_schema_rejects_other_files(tmp_path):
+    path = tmp_path / 'schema.json'
+    path.write_text(json.dumps({'format': 1, 'choices': {}, 'questions': {}}))
+    with pytest.raises(ValueError):
+        load_schema(str(path))
+
+
+def test_import_does_not_load_requests():
+    code = ('import sys, koboextractor; '
+            'print(sorted(m for m in ("requests", "sqlite3", "multiprocessing", "msgpack") '
+            'if m in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert output.stdout.strip() == '[]'